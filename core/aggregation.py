@@ -0,0 +1,187 @@
+import os
+import numpy as np
+import xarray as xr
+
+from core.io import fn_period_pattern, fn_past, open_dataset
+from core.utilities import decode_time, drop_leap_days
+
+seasons = ['DJF', 'MAM', 'JJA', 'SON']
+# number of days per period in the 365-day calendar of the base distributions
+month_lengths = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+season_lengths = np.array([90, 92, 92, 91])
+
+
+def get_period_means(da, period='month', dayofyear=None, complete=False):
+    """Mean of each period of each year.
+
+    Periods are calendar months, meteorological seasons (DJF is assigned to
+    the year of January and February) or the year to date (1. Jan. until
+    `dayofyear`). The number of time steps per period and whether the period
+    is complete are attached as coordinates 'ndays' and 'complete'.
+
+    Parameters
+    ----------
+    da : xr.DataArray, shape (N, ...)
+        Daily values, sorted in time.
+    period : {'month', 'season', 'ytd'}
+    dayofyear : int, optional
+        Last day of the year-to-date period. Needs to be given for 'ytd'.
+    complete : bool, by default False
+        If True, periods with missing days are set to NaN.
+
+    Return
+    ------
+    xr.DataArray, shape (years, periods, ...)
+    """
+    if period == 'month':
+        labels, lengths = np.arange(1, 13), month_lengths
+        key = da['time.month'].values - 1
+        year = da['time.year'].values
+    elif period == 'season':
+        labels, lengths = seasons, season_lengths
+        month = da['time.month'].values
+        key = (month % 12) // 3
+        year = da['time.year'].values + (month == 12)
+    elif period == 'ytd':
+        if dayofyear is None:
+            raise ValueError('dayofyear needs to be given for year-to-date periods')
+        labels, lengths = [dayofyear], np.array([dayofyear])
+        doy = decode_time(da['time'])[1]  # leap days get 0
+        da = da.isel(time=(doy >= 1) & (doy <= dayofyear))
+        key = np.zeros(da['time'].size, dtype=int)
+        year = da['time.year'].values
+    else:
+        raise NotImplementedError(period)
+
+    if da['time'].size == 0:
+        raise ValueError('No time steps selected')
+
+    years = np.unique(year)
+    group = np.searchsorted(years, year) * len(labels) + key
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(group)) + 1])
+    if np.unique(group[starts]).size != starts.size:
+        raise ValueError('Time steps need to be sorted')
+
+    # sum up contiguous periods in one pass, skipping missing values
+    values = da.transpose('time', ...).values
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0), starts, axis=0)
+    counts = np.add.reduceat(valid.astype(int), starts, axis=0)
+
+    shape = (years.size * len(labels), ) + values.shape[1:]
+    means = np.full(shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means[group[starts]] = np.where(counts > 0, sums / counts, np.nan)
+    ndays = np.zeros(years.size * len(labels), dtype=int)
+    ndays[group[starts]] = np.diff(np.concatenate([starts, [group.size]]))
+
+    means = means.reshape((years.size, len(labels)) + values.shape[1:])
+    ndays = ndays.reshape(years.size, len(labels))
+    if complete:
+        means[ndays < lengths] = np.nan
+
+    dims = ('year', 'period') + da.transpose('time', ...).dims[1:]
+    coords = {name: coord for name, coord in da.coords.items() if 'time' not in coord.dims}
+    return xr.DataArray(
+        means,
+        dims=dims,
+        coords={
+            **coords,
+            'year': years,
+            'period': labels,
+            'ndays': (('year', 'period'), ndays),
+            'complete': (('year', 'period'), ndays >= lengths),
+        },
+        name=da.name,
+        attrs={**da.attrs, 'period': period},
+    )
+
+
+def get_base_period_means(
+    varn='tas',
+    period='month',
+    dayofyear=None,
+    location=None,
+    startyear_base=1940,
+    endyear_base=2024,
+    fn=fn_past,
+    dataset='era5',
+    resolution='native',
+    overwrite=False,
+):
+    """Base distribution of period means, cached on disk.
+
+    The raw history is processed year by year so that memory is bounded by one
+    year of data also for global fields. If `location` is given only the
+    nearest grid cell is processed and cached.
+
+    Return
+    ------
+    xr.DataArray, shape (years, periods, ...)
+    """
+    fn_out = fn_period_pattern.format(
+        dataset=dataset,
+        resolution=resolution,
+        varn=varn,
+        period=period if period != 'ytd' else 'ytd{:03d}'.format(dayofyear),
+        startyear=startyear_base,
+        endyear=endyear_base,
+        region='global' if location is None else list(location.keys())[0],
+    )
+    if os.path.isfile(fn_out) and not overwrite:
+        return xr.open_dataset(fn_out)[varn]
+
+    da = open_dataset(fn)[varn]
+    if location is not None:
+        da = da.sel(**list(location.values())[0], method='nearest').load()
+
+    means = []
+    for year in range(startyear_base, endyear_base + 1):
+        if period == 'season':  # December of the previous year belongs to DJF
+            da_sel = da.sel(time=slice(f'{year - 1}-12-01', f'{year}-11-30'))
+        else:
+            da_sel = da.sel(time=str(year))
+        # delete Feb 29th to be consistent with the daily base distributions
+        da_sel = drop_leap_days(da_sel.load())
+        means.append(get_period_means(da_sel, period, dayofyear, complete=True))
+    means = xr.concat(means, dim='year')
+    means.attrs.update({'startyear': startyear_base, 'endyear': endyear_base})
+
+    os.makedirs(os.path.dirname(fn_out), exist_ok=True)
+    means.to_dataset(name=varn).to_netcdf(fn_out)
+    return means
+
+
+def get_period_statistics(da, base):
+    """Anomalies and percentile ranks of period means relative to the base.
+
+    All periods, years and grid cells are computed in one vectorised step.
+    Incomplete periods (e.g., the current month) can not be compared to the
+    complete periods of the base: their anomalies and ranks are NaN. Use
+    period 'ytd' to compare the year so far to the same days of the base.
+
+    Parameters
+    ----------
+    da : xr.DataArray, shape (N, ...)
+        Daily values to evaluate, same units as `base`.
+    base : xr.DataArray, shape (years, periods, ...)
+        Output of get_base_period_means.
+    """
+    period = base.attrs['period']
+    dayofyear = base['period'].item() if period == 'ytd' else None
+    # delete Feb 29th to be consistent with the base periods
+    current = get_period_means(drop_leap_days(da), period, dayofyear)
+    base = base.drop_vars(['ndays', 'complete'], errors='ignore').rename({'year': 'year_base'})
+
+    valid = current.notnull() & current['complete']
+    anom = (current - base.mean('year_base')).where(valid)
+    nbase = base.notnull().sum('year_base')
+    rank = (
+        (base < current).sum('year_base') + .5 * (base == current).sum('year_base')
+    ) / nbase * 100
+    return {
+        'period mean': current,
+        'difference to mean': anom,
+        'standard deviations to mean': anom / base.std('year_base'),
+        'percentile rank': rank.transpose(*current.dims).where(valid),
+    }
@@ -29,6 +29,35 @@ def _reply_to(reply_root, reply_parent):
     }
 
 
+def _read(fn):
+    """Return the content of a file, buffer object or bytes."""
+    if isinstance(fn, (bytes, bytearray)):
+        return bytes(fn)
+    if hasattr(fn, 'getvalue'):  # e.g., io.BytesIO
+        return fn.getvalue()
+    if hasattr(fn, 'read'):
+        if fn.seekable():  # leave the position unchanged for repeated reads
+            pos = fn.tell()
+            data = fn.read()
+            fn.seek(pos)
+            return data
+        return fn.read()
+    with open(fn, 'rb') as ff:
+        return ff.read()
+
+
+def _get_format(fn):
+    """Return the image format from the file extension or the content."""
+    if isinstance(fn, (str, os.PathLike)):
+        return os.path.splitext(fn)[1].lstrip('.').lower()
+    header = _read(fn)[:8]
+    if header.startswith(b'\x89PNG'):
+        return 'png'
+    if header.startswith(b'GIF8'):
+        return 'gif'
+    return None
+
+
 def post_image(
     fn, 
     text='', 
@@ -45,8 +74,7 @@ def post_image(
     client = Client()
     client.login('weather-climate.bsky.social', passwort)
 
-    with open(fn, 'rb') as ff:
-        img = ff.read()
+    img = _read(fn)
         
     return client.send_image(
         text=text,
@@ -77,8 +105,7 @@ def post_gif(
     client = Client()
     client.login('weather-climate.bsky.social', passwort)
 
-    with open(fn, 'rb') as ff:
-        gif = ff.read()
+    gif = _read(fn)
         
     return client.send_video(
         text=text,
@@ -97,9 +124,11 @@ def post(
     reply_parent=None,
     langs=['english', 'german'],
 ):
-    if fn.endswith('.png'):
+    """Post an image or gif, given as filename, buffer object or bytes."""
+    format_ = _get_format(fn)
+    if format_ == 'png':
         return post_image(fn, text=text, image_alt=alt, reply_root=reply_root, reply_parent=reply_parent, langs=langs)
-    elif fn.endsweith('.gif'):
+    elif format_ == 'gif':
         return post_gif(fn, text=text, gif_alt=alt, reply_root=reply_root, reply_parent=reply_parent, langs=langs)
     else:
         raise NotImplementedError
@@ -0,0 +1,55 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+def plot_calendar_base(startyear, endyear, dpi_ratio=1, language='en'):
+    nyears = endyear - startyear + 1
+    fig, ax = plt.subplots(
+            figsize=(12 / dpi_ratio, max(6, nyears * .12) / dpi_ratio), dpi=120*dpi_ratio
+    )
+    ax.set_xlim(.5, 365.5)
+    ax.set_ylim(endyear + .5, startyear - .5)
+    ax.set_xticks([1, 60, 121, 182, 243, 304, 365])
+
+    if language == 'en':
+        ax.set_ylabel("Year")
+        ax.set_xticklabels(["1. Jan.", "1. Mar.", "1. May", "1. Jul.", "1. Sep", "1. Nov.", "31. Dec."])
+    elif language == 'dt':
+        ax.set_ylabel("Jahr")
+        ax.set_xticklabels(["1. Jän.", "1. März", "1. Mai", "1. Jul.", "1. Sep", "1. Nov.", "31. Dez."])
+    else:
+        raise NotImplementedError(language)
+
+    return fig, ax
+
+
+def plot_calendar(ax, da, cmap='RdBu_r', vmin=None, vmax=None, label=None):
+    """Year by day-of-year heatmap.
+
+    Parameters
+    ----------
+    da : xr.DataArray, shape (years, 365)
+        E.g., output of core.utilities.to_year_doy.
+    vmin, vmax : float, optional
+        Default to a range symmetric around zero.
+    """
+    if vmin is None and vmax is None:
+        vmax = np.nanmax(np.abs(da.values))
+        vmin = -vmax
+
+    # cell edges
+    doy = np.arange(da['dayofyear'].size + 1) + .5
+    year = np.arange(da['year'][0].item(), da['year'][-1].item() + 2) - .5
+    mesh = ax.pcolormesh(
+        doy,
+        year,
+        da.transpose('year', 'dayofyear').values,
+        cmap=cmap,
+        vmin=vmin,
+        vmax=vmax,
+        shading='flat',
+    )
+    cbar = plt.colorbar(mesh, ax=ax, pad=.01, fraction=.03)
+    if label is not None:
+        cbar.set_label(label)
+    return mesh
@@ -0,0 +1,113 @@
+import numpy as np
+
+from core.utilities import convert_to_doy
+
+
+class Climatology:
+    """Compact day-of-year climatology of the base distribution.
+
+    Holds the mean, standard deviation and percentiles of the base period as
+    contiguous float arrays indexed by day of year - 1 (0..364), following the
+    365-day convention of the base distributions. Additional (spatial)
+    dimensions are kept as trailing axes in the order given by `dims`.
+
+    Build it once per run with `Climatology.from_dataarrays` and pass it to
+    the plotting and statistics functions instead of the xarray objects.
+
+    Attributes
+    ----------
+    mean : np.ndarray, shape (365, ...)
+    std : np.ndarray, shape (365, ...)
+    perc : np.ndarray, shape (M, 365, ...)
+    percentiles : np.ndarray, shape (M)
+    dims : tuple of str
+        Names of the trailing (spatial) dimensions, empty for a single location.
+    """
+    __slots__ = ('mean', 'std', 'perc', 'percentiles', 'dims')
+
+    ndays = 365
+
+    def __init__(self, mean, perc, std, percentiles, dims=()):
+        self.mean = np.ascontiguousarray(mean, dtype=float)
+        self.std = np.ascontiguousarray(std, dtype=float)
+        self.perc = np.ascontiguousarray(perc, dtype=float)
+        self.percentiles = np.ascontiguousarray(percentiles, dtype=int)
+        self.dims = tuple(dims)
+
+        if self.mean.shape[0] != self.ndays:
+            raise ValueError(f'Expected {self.ndays} days of year, found: {self.mean.shape[0]}')
+        if self.perc.shape != (self.percentiles.size, ) + self.mean.shape:
+            raise ValueError(f'Inconsistent percentile shape: {self.perc.shape}')
+
+    @classmethod
+    def from_dataarrays(cls, da_mean, da_perc, da_std):
+        """Convert the base distribution xarray objects (once)."""
+        da_mean = convert_to_doy(da_mean)
+        da_std = convert_to_doy(da_std)
+        da_perc = convert_to_doy(da_perc)
+        dims = [dim for dim in da_mean.dims if dim != 'dayofyear']
+
+        if not np.array_equal(da_mean['dayofyear'], np.arange(1, cls.ndays + 1)):
+            raise ValueError('Base distribution needs to cover all days of a 365-day year')
+
+        return cls(
+            mean=da_mean.transpose('dayofyear', *dims).values,
+            perc=da_perc.transpose('percentile', 'dayofyear', *dims).values,
+            std=da_std.transpose('dayofyear', *dims).values,
+            percentiles=da_perc['percentile'].values,
+            dims=dims,
+        )
+
+    @classmethod
+    def stack(cls, clims, dim='base'):
+        """Stack several climatologies (e.g., base periods) along a new trailing dimension."""
+        if any(not np.array_equal(clim.percentiles, clims[0].percentiles) for clim in clims):
+            raise ValueError('All climatologies need to have the same percentiles')
+        if any(clim.dims != clims[0].dims for clim in clims):
+            raise ValueError('All climatologies need to have the same dimensions')
+        return cls(
+            mean=np.stack([clim.mean for clim in clims], axis=-1),
+            perc=np.stack([clim.perc for clim in clims], axis=-1),
+            std=np.stack([clim.std for clim in clims], axis=-1),
+            percentiles=clims[0].percentiles,
+            dims=clims[0].dims + (dim, ),
+        )
+
+    @property
+    def dayofyear(self):
+        return np.arange(1, self.ndays + 1)
+
+    def index(self, dayofyear):
+        """Convert day of year to array index. Days outside 1..365 give -1."""
+        idx = np.asarray(dayofyear, dtype=int) - 1
+        return np.where((idx >= 0) & (idx < self.ndays), idx, -1)
+
+    def take(self, name, dayofyear):
+        """Select values of `name` for the given day(s) of year.
+
+        Days without a base value (e.g., day 366 of a leap year) are NaN.
+        """
+        values = getattr(self, name)
+        axis = 1 if name == 'perc' else 0
+        idx = self.index(dayofyear)
+        selected = np.take(values, idx, axis=axis)
+        if np.any(idx < 0):
+            mask = np.reshape(idx < 0, idx.shape + (1, ) * (selected.ndim - axis - idx.ndim))
+            selected = np.where(mask, np.nan, selected)
+        return selected
+
+    def percentile(self, pp):
+        """Return the row of percentile `pp`."""
+        idx = np.flatnonzero(self.percentiles == pp)
+        if idx.size == 0:
+            raise ValueError(f'Percentile {pp} not in {self.percentiles}')
+        return self.perc[idx[0]]
+
+
+def as_climatology(da_mean, da_perc=None, da_std=None):
+    """Return a Climatology, converting the xarray base distribution if needed."""
+    if isinstance(da_mean, Climatology):
+        return da_mean
+    if da_perc is None or da_std is None:
+        raise ValueError('Percentiles and standard deviation are needed if mean is not a Climatology')
+    return Climatology.from_dataarrays(da_mean, da_perc, da_std)
@@ -0,0 +1,284 @@
+import os
+import numpy as np
+import xarray as xr
+from glob import glob
+
+from core.io import fn_events_pattern
+
+# default percentile thresholds
+thresholds = {'heatwave': 90, 'coldspell': 10}
+
+
+def get_exceedance(band, kind='heatwave', threshold=None):
+    """Days above (heatwave) or below (coldspell) the threshold percentile.
+
+    Parameters
+    ----------
+    band : xr.DataArray, shape (N, ..., 2)
+        Percentile band, output of get_percentile_band.
+    """
+    if threshold is None:
+        threshold = thresholds[kind]
+    if kind == 'heatwave':
+        return band.isel(bounds=0) >= threshold
+    if kind == 'coldspell':
+        return band.isel(bounds=1) <= threshold
+    raise NotImplementedError(kind)
+
+
+def _to_cells(da):
+    """Reshape (time, ...) to a (cells, time) array."""
+    da = da.transpose('time', ...)
+    return da.values.reshape(da.shape[0], -1).T
+
+
+def run_length_encode(mask):
+    """Vectorised run-length encoding of True values along the last axis.
+
+    Parameters
+    ----------
+    mask : np.ndarray of bool, shape (C, N)
+
+    Return
+    ------
+    cell, start, end : np.ndarray of int
+        Cell index, first and last + 1 time index of each run, sorted by cell
+        and start.
+    """
+    diff = np.diff(np.pad(mask.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    cell, start = np.nonzero(diff == 1)
+    _, end = np.nonzero(diff == -1)
+    return cell, start, end
+
+
+def get_events(info, kind='heatwave', threshold=None, min_duration=3, carry=None, open_end=True):
+    """Detect heatwaves or cold spells as runs of days beyond a percentile.
+
+    Works for single locations, the full record and grids alike; all events
+    are found in one vectorised pass.
+
+    Parameters
+    ----------
+    info : dict
+        Output of get_statistics.
+    kind : {'heatwave', 'coldspell'}
+    threshold : int, optional
+        Percentile, defaults to `thresholds[kind]`.
+    min_duration : int, by default 3
+        Minimum number of consecutive days.
+    carry : xr.Dataset, optional
+        Output of get_trailing for the period directly before `info`. Runs on
+        the first day are continued with the run at its end; if the first day
+        is no exceedance the run at its end is an event of its own.
+    open_end : bool, by default True
+        If False, runs reaching the last day are skipped as they continue in
+        the next period.
+
+    Return
+    ------
+    xr.Dataset, shape (events)
+        Start, end, duration, intensity (mean anomaly) and peak (extreme
+        anomaly) of each event, with the spatial coordinates of the cell.
+    """
+    if threshold is None:
+        threshold = thresholds[kind]
+    mask = get_exceedance(info['percentile band'], kind, threshold).transpose('time', ...)
+    anom = info['difference to mean'].transpose(*mask.dims)
+    dims, shape = mask.dims[1:], mask.shape[1:]
+
+    mask_cells = _to_cells(mask)
+    anom_cells = _to_cells(anom).astype(float)
+    ntime = mask_cells.shape[1]
+
+    cell, start, end = run_length_encode(mask_cells)
+    if not open_end:
+        keep = end < ntime
+        cell, start, end = cell[keep], start[keep], end[keep]
+
+    # anomaly sums from cumulative sums
+    csum = np.concatenate([np.zeros((anom_cells.shape[0], 1)), np.nancumsum(anom_cells, axis=1)], axis=1)
+    total = csum[cell, end] - csum[cell, start]
+
+    # extreme anomaly from a reduction over the (non-overlapping) event segments
+    flat = np.append(anom_cells.ravel(), np.nan)
+    reduce = np.fmax if kind == 'heatwave' else np.fmin
+    if cell.size > 0:
+        indices = np.stack([cell * ntime + start, cell * ntime + end], axis=-1).ravel()
+        peak = reduce.reduceat(flat, indices)[::2]
+    else:
+        peak = np.array([])
+
+    # continue runs of the previous period
+    extra = np.zeros_like(start)
+    if carry is not None:
+        extra = np.where(start == 0, carry['trailing run'].values[cell], 0)
+        total = total + np.where(extra > 0, carry['trailing sum'].values[cell], 0)
+        peak = np.where(extra > 0, reduce(peak, carry['trailing peak'].values[cell]), peak)
+
+        # runs of the previous period which ended on its last day (start = end = 0)
+        closed = np.flatnonzero((carry['trailing run'].values > 0) & ~mask_cells[:, 0])
+        zeros = np.zeros_like(closed)
+        order = np.argsort(np.concatenate([closed, cell]), kind='stable')
+        cell = np.concatenate([closed, cell])[order]
+        start = np.concatenate([zeros, start])[order]
+        end = np.concatenate([zeros, end])[order]
+        extra = np.concatenate([carry['trailing run'].values[closed], extra])[order]
+        total = np.concatenate([carry['trailing sum'].values[closed], total])[order]
+        peak = np.concatenate([carry['trailing peak'].values[closed], peak])[order]
+
+    duration = end - start + extra
+    keep = duration >= min_duration
+    cell, start, end, extra = cell[keep], start[keep], end[keep], extra[keep]
+    duration, total, peak = duration[keep], total[keep], peak[keep]
+
+    time = mask['time'].values
+    index = np.unravel_index(cell, shape) if len(shape) > 0 else ()
+    return xr.Dataset(
+        {
+            'start': ('event', time[start] - extra.astype('timedelta64[D]')),
+            'end': ('event', np.where(end > 0, time[end - 1], time[0] - np.timedelta64(1, 'D'))),
+            'duration': ('event', duration),
+            'intensity': ('event', total / duration),
+            'peak': ('event', peak),
+        },
+        coords={dim: ('event', mask[dim].values[idx]) for dim, idx in zip(dims, index)},
+        attrs={'kind': kind, 'threshold': threshold, 'min_duration': min_duration},
+    )
+
+
+def get_trailing(info, kind='heatwave', threshold=None, carry=None):
+    """Length, anomaly sum and extreme anomaly of the run on the last day.
+
+    Runs covering the full period are continued with `carry` (output of
+    get_trailing for the period directly before). The values are flattened
+    over the grid cells (dimension 'cell', in the order of the spatial
+    dimensions).
+    """
+    mask = get_exceedance(info['percentile band'], kind, threshold).transpose('time', ...)
+    anom = info['difference to mean'].transpose(*mask.dims)
+    mask_cells = _to_cells(mask)
+    ntime = mask_cells.shape[1]
+
+    run = np.where(mask_cells.all(axis=1), ntime, np.argmin(mask_cells[:, ::-1], axis=1))
+    trailing = np.where(np.arange(ntime) >= ntime - run[:, None], _to_cells(anom).astype(float), np.nan)
+    total = np.nansum(trailing, axis=1)
+    reduce = np.fmax if kind == 'heatwave' else np.fmin
+    peak = reduce.reduce(trailing, axis=1)
+
+    if carry is not None:
+        full = run == ntime
+        run = run + np.where(full, carry['trailing run'].values, 0)
+        total = total + np.where(full, carry['trailing sum'].values, 0)
+        peak = np.where(full, reduce(peak, carry['trailing peak'].values), peak)
+
+    return xr.Dataset({
+        'trailing run': ('cell', run),
+        'trailing sum': ('cell', total),
+        'trailing peak': ('cell', peak),
+    })
+
+
+def get_current_run(info, kind='heatwave', threshold=None):
+    """Number of consecutive days beyond the threshold up to the last day."""
+    mask = get_exceedance(info['percentile band'], kind, threshold).transpose('time', ...)
+    values = mask.values
+    run = np.where(values.all(axis=0), values.shape[0], np.argmin(values[::-1], axis=0))
+    return xr.DataArray(
+        run,
+        dims=mask.dims[1:],
+        coords={dim: mask[dim] for dim in mask.dims[1:] if dim in mask.coords},
+    )
+
+
+def _get_fn_events(metadata, year, kind, threshold, min_duration, resolution='native'):
+    return fn_events_pattern.format(
+        dataset='era5',
+        resolution=resolution,
+        startyear=metadata['startyear_base'],
+        endyear=metadata['endyear_base'],
+        window=metadata['window_base'],
+        varn=metadata['varn'],
+        kind=kind,
+        threshold=threshold,
+        min_duration=min_duration,
+        region=list(metadata['location'].keys())[0],
+        year=year,
+    )
+
+
+def get_events_cached(info, kind='heatwave', threshold=None, min_duration=3, resolution='native', overwrite=False):
+    """Events per year, cached on disk for complete years.
+
+    Events are assigned to the year they end in. Runs at the end of a year
+    continue into the next one: their length, anomaly sum and extreme
+    anomaly are stored (see get_trailing) and carried over, so events are not
+    split at the turn of the year. Events ending on 31. Dec. are therefore
+    only known to be complete with the next year and are listed there. Only
+    the last year contains events which are still ongoing on its last day.
+
+    Only years covering 1. Jan. to 31. Dec. are cached.
+
+    Return
+    ------
+    dict of {year: xr.Dataset}
+    """
+    if threshold is None:
+        threshold = thresholds[kind]
+    time = info['percentile band']['time']
+    years = np.unique(time.dt.year.values)
+    varns_trailing = ['trailing run', 'trailing sum', 'trailing peak']
+
+    carry = None
+    fn_previous = _get_fn_events(info['metadata'], years[0] - 1, kind, threshold, min_duration, resolution)
+    if time.dt.month[0].item() == 1 and time.dt.day[0].item() == 1 and os.path.isfile(fn_previous):
+        with xr.open_dataset(fn_previous) as ds:
+            carry = ds[varns_trailing].load()
+
+    events = {}
+    for year in years:
+        fn = _get_fn_events(info['metadata'], year, kind, threshold, min_duration, resolution)
+        if os.path.isfile(fn) and not overwrite:
+            events[year] = xr.open_dataset(fn)
+            carry = events[year][varns_trailing]
+            continue
+
+        info_year = {key: value.sel(time=str(year)) for key, value in info.items() if key != 'metadata'}
+        trailing = get_trailing(info_year, kind, threshold, carry)
+        ds = xr.merge([get_events(info_year, kind, threshold, min_duration, carry, open_end=False), trailing])
+
+        time_year = info_year['percentile band']['time']
+        if (
+            time_year.dt.month[0].item() == 1 and time_year.dt.day[0].item() == 1
+            and time_year.dt.month[-1].item() == 12 and time_year.dt.day[-1].item() == 31
+        ):
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+            ds.to_netcdf(fn)
+
+        if year == years[-1]:
+            ds = xr.merge([get_events(info_year, kind, threshold, min_duration, carry, open_end=True), trailing])
+        events[year] = ds
+        carry = trailing
+    return events
+
+
+def get_event_day(info, kind='heatwave', threshold=None, resolution='native'):
+    """Day N of the ongoing event on the last day (0 if there is none).
+
+    Runs covering the full current year so far are continued with the
+    trailing run of the previous year if it is cached (see
+    get_events_cached). Compare N with the minimum duration to decide whether
+    the run already is an event.
+    """
+    if threshold is None:
+        threshold = thresholds[kind]
+    run = get_current_run(info, kind, threshold)
+    time = info['percentile band']['time']
+    year = time.dt.year.values[-1]
+    ndays = (time.dt.year.values == year).sum()
+
+    fn_previous = _get_fn_events(info['metadata'], year - 1, kind, threshold, '*', resolution)
+    fns_previous = sorted(glob(fn_previous))
+    if (run == ndays).any() and len(fns_previous) > 0:
+        with xr.open_dataset(fns_previous[0]) as ds:
+            run = run.where(run != ndays, run + ds['trailing run'].values.reshape(run.shape))
+    return run
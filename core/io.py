@@ -1,4 +1,12 @@
 import os
+import netCDF4
+import numpy as np
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from glob import glob
+
+from core.utilities import standard_calendars
 
 basepath = '/work/uc1275/LukasBrunner/bluesky_bot'
 
@@ -6,5 +14,439 @@ path_base_pattern = 'base_distributions/{dataset}_{resolution}_b{startyear}-{end
 fn_base_pattern = '{varn}_day_{dataset}_b{startyear}-{endyear}_w{window}_{metric}.nc'
 fn_base_pattern = os.path.join(basepath, path_base_pattern, fn_base_pattern)
 
+path_period_pattern = 'base_distributions/{dataset}_{resolution}_b{startyear}-{endyear}_periods'
+fn_period_pattern = '{varn}_{period}mean_{dataset}_b{startyear}-{endyear}_{region}.nc'
+fn_period_pattern = os.path.join(basepath, path_period_pattern, fn_period_pattern)
+
+path_events_pattern = 'events/{dataset}_{resolution}_b{startyear}-{endyear}_w{window}'
+fn_events_pattern = '{varn}_{kind}_p{threshold}_d{min_duration}_{region}_{year}.nc'
+fn_events_pattern = os.path.join(basepath, path_events_pattern, fn_events_pattern)
+
 fn_past = os.path.join(basepath, 'raw_data', 'tas_day_era5.nc')
 fn_current = os.path.join(basepath, 'raw_data', 'tas_day_reanalysis_era5_r1i1p1_20250101-20251231.nc')
+
+# background writer for archiving rendered figures without blocking the caller
+_writer = ThreadPoolExecutor(max_workers=1)
+_pending_writes = []
+
+# grid spacing (degree) of the resolution levels; coarser levels are built by core.pyramid
+resolutions = {
+    'native': .25,
+    '0.5deg': .5,
+    '1deg': 1.,
+    '2.5deg': 2.5,
+}
+
+
+def get_fn_raw(fn, resolution='native'):
+    """Filename of raw data at the given resolution level."""
+    if resolution == 'native':
+        return fn
+    path, fn = os.path.split(fn)
+    return os.path.join(path, resolution, fn)
+
+
+def select_resolution(region=None, map_size=None, min_cells=10, fn=None, **fn_kwargs):
+    """Select the coarsest resolution level sufficient for a region or map.
+
+    Parameters
+    ----------
+    region : dict, optional
+        {'lat': (south, north), 'lon': (west, east)}. Defaults to the globe.
+        Point locations ({'lat': 53, 'lon': 10}) always use the native grid.
+    map_size : tuple of int, optional
+        (width, height) of the map in pixels. One grid cell per pixel is
+        considered sufficient.
+    min_cells : int, by default 10
+        Only used without `map_size` (e.g., for region means): minimum number of
+        grid cells along each direction of the region.
+    fn : str or callable, optional
+        If given, only levels which exist on disk are considered. Either a
+        filename pattern containing a '{resolution}' placeholder (other
+        placeholders are filled from `fn_kwargs`, wildcards are allowed) or a
+        callable mapping a level to a filename or a list of filenames which
+        all need to exist, e.g., `lambda res: get_fn_raw(fn_past, res)`.
+
+    Return
+    ------
+    str, key of `resolutions`
+    """
+    if region is None:
+        region = {'lat': (-90, 90), 'lon': (0, 360)}
+    if not isinstance(region['lat'], (tuple, list)) or not isinstance(region['lon'], (tuple, list)):
+        return 'native'
+
+    extent_lat = abs(region['lat'][1] - region['lat'][0])
+    extent_lon = (region['lon'][1] - region['lon'][0]) % 360 or 360
+    if map_size is None:
+        required = min(extent_lat, extent_lon) / min_cells
+    else:
+        required = min(extent_lon / map_size[0], extent_lat / map_size[1])
+
+    for resolution, spacing in sorted(resolutions.items(), key=lambda x: x[1], reverse=True):
+        if spacing > required:
+            continue
+        if fn is not None and not _level_exists(fn, resolution, **fn_kwargs):
+            continue
+        return resolution
+    return 'native'
+
+
+def _level_exists(fn, resolution, **fn_kwargs):
+    if callable(fn):
+        filenames = fn(resolution)
+    else:
+        filenames = fn.format(resolution=resolution, **fn_kwargs)
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    return all(len(glob(filename)) > 0 for filename in filenames)
+
+
+def open_dataset(fn, **kwargs):
+    """Open a netCDF file without creating cftime objects.
+
+    Time in standard calendars is decoded to datetime64 (vectorised). Other
+    calendars (e.g., the 365-day calendar of the base distributions) keep the
+    numeric time values; use core.utilities.decode_time to get year and day
+    of year.
+    """
+    ds = xr.open_dataset(fn, decode_times=False, **kwargs)
+    return _decode_standard_time(ds)
+
+
+def _decode_standard_time(ds):
+    if 'time' not in ds.variables or 'units' not in ds['time'].attrs:
+        return ds
+    attrs = ds['time'].attrs
+    calendar = attrs.get('calendar', 'standard').lower()
+    if calendar not in standard_calendars:
+        return ds
+    time = xr.coding.times.decode_cf_datetime(
+        ds['time'].values, attrs['units'], calendar, use_cftime=False)
+    ds = ds.assign_coords(time=time)
+    ds['time'].encoding.update({'units': attrs['units'], 'calendar': calendar})
+    return ds
+
+
+@lru_cache(maxsize=16)
+def open_base_distribution(
+    varn='tas',
+    startyear_base=1940,
+    endyear_base=2024,
+    window_base=1,
+    resolution='native',
+    dataset='era5',
+    compact=None,
+):
+    """Open (lazily) the mean, percentiles and standard deviation of a base period.
+
+    The opened datasets are cached, so repeated calls (e.g., for several
+    locations) do not re-open the files.
+
+    Parameters
+    ----------
+    compact : bool, optional
+        Read the quantised encoding (see encode_base_distribution) instead of
+        the float files. By default it is used if it exists.
+    """
+    fn_base = fn_base_pattern.format(
+        dataset=dataset,
+        resolution=resolution,
+        varn=varn,
+        window=window_base,
+        startyear=startyear_base,
+        endyear=endyear_base,
+        metric='{}',
+    )
+
+    if compact is None:
+        compact = os.path.isfile(fn_base.format('compact'))
+    if compact:
+        return decode_base_distribution(fn_base.format('compact'), varn)
+
+    # time is kept numeric (365-day calendar), see core.utilities.decode_time
+    mean = open_dataset(fn_base.format('ydrunmean'))[varn]
+    std = open_dataset(fn_base.format('std'))[varn]
+
+    perc = xr.open_mfdataset(
+        fn_base.format('p*'),
+        decode_times=False,
+        combine='nested',
+        concat_dim='percentile',
+        preprocess=lambda x: x.expand_dims({'percentile': [int(x.attrs['percentile'])]})
+        )[varn]
+    perc = perc.sortby('percentile')
+    return mean, perc, std
+
+
+# quantisation of the compact base distributions: int16 values -32767..32767,
+# -32768 marks missing values
+_fill = -32768
+_nsteps = 65534
+
+
+def _quantise(values, offset, scale, round_=np.round):
+    q = np.clip(round_((values - offset) / scale) - _nsteps // 2, -_nsteps // 2, _nsteps // 2)
+    return np.where(np.isnan(values), _fill, q).astype(np.int16)
+
+
+def encode_base_distribution(
+    varn='tas',
+    startyear_base=1940,
+    endyear_base=2024,
+    window_base=1,
+    resolution='native',
+    dataset='era5',
+    chunk_size=20,
+    overwrite=False,
+):
+    """Write a compact, quantised encoding of a base distribution.
+
+    Mean, percentiles and standard deviation (the 23 float files written by
+    the scripts in cdo_cripts) are stored in one compressed file:
+    - the lowest percentile and the mean as int16 with a common scale/offset
+    - the other percentiles as uint16 increments to the next lower one
+      (percentiles are monotone, so all increments are >= 0)
+    - the standard deviation as int16 with its own scale/offset
+
+    Error bound: with 65534 quantisation steps over the range of the
+    percentiles, the absolute error of the mean and the inner percentiles is
+    at most scale / 2; e.g., 0.0011 K for a range of 145 K. The increments are
+    exact on the integer grid, so errors do not accumulate over percentiles.
+    The lowest (highest) percentile is rounded down (up) to avoid spurious
+    records in-sample, i.e., its error is at most one step. The attribute
+    'max_abs_error' holds this overall bound (scale). The standard deviation
+    is rounded, its error is at most 'max_abs_error_std' (scale_std / 2).
+
+    The file is written in chunks of `chunk_size` latitudes.
+    """
+    fn_base = fn_base_pattern.format(
+        dataset=dataset,
+        resolution=resolution,
+        varn=varn,
+        window=window_base,
+        startyear=startyear_base,
+        endyear=endyear_base,
+        metric='{}',
+    )
+    fn_out = fn_base.format('compact')
+    if os.path.isfile(fn_out) and not overwrite:
+        return fn_out
+
+    mean, perc, std = open_base_distribution(
+        varn, startyear_base, endyear_base, window_base, resolution, dataset, compact=False)
+    perc = perc.transpose('percentile', 'time', 'lat', 'lon')
+    mean = mean.transpose('time', 'lat', 'lon')
+    std = std.transpose('time', 'lat', 'lon')
+
+    offset = float(perc.min())
+    scale = (float(perc.max()) - offset) / _nsteps or 1.
+    offset_std = float(std.min())
+    scale_std = (float(std.max()) - offset_std) / _nsteps or 1.
+
+    with netCDF4.Dataset(fn_out, 'w') as nc:
+        nc.setncatts({
+            'varn': varn,
+            'scale': scale,
+            'offset': offset,
+            'max_abs_error': scale,
+            'scale_std': scale_std,
+            'offset_std': offset_std,
+            'max_abs_error_std': scale_std / 2,
+            'startyear': startyear_base,
+            'endyear': endyear_base,
+            'window': window_base,
+        })
+        for dim, values in [
+                ('time', perc['time']),
+                ('percentile', perc['percentile']),
+                ('dpercentile', perc['percentile'][1:]),
+                ('lat', perc['lat']),
+                ('lon', perc['lon'])]:
+            nc.createDimension(dim, values.size)
+            var = nc.createVariable(dim, values.dtype, (dim, ))
+            var[:] = values.values
+            var.setncatts(values.attrs)
+
+        dims = ('time', 'lat', 'lon')
+        kwargs = dict(zlib=True, complevel=4, shuffle=True)
+        nc.createVariable('perc0', 'i2', dims, **kwargs)
+        nc.createVariable('dperc', 'u2', ('dpercentile', ) + dims, **kwargs)
+        nc.createVariable('mean', 'i2', dims, **kwargs)
+        nc.createVariable('std', 'i2', dims, **kwargs)
+
+        for idx in range(0, perc['lat'].size, chunk_size):
+            lat = slice(idx, idx + chunk_size)
+            values = perc.isel(lat=lat).values
+            q = np.concatenate([
+                _quantise(values[:1], offset, scale, np.floor),
+                _quantise(values[1:-1], offset, scale),
+                _quantise(values[-1:], offset, scale, np.ceil),
+            ]).astype(np.int32)
+            q = np.maximum.accumulate(q, axis=0)  # guard against rounding in non-monotone input
+            nc['perc0'][:, lat] = q[0]
+            nc['dperc'][:, :, lat] = np.diff(q, axis=0).astype(np.uint16)
+            nc['mean'][:, lat] = _quantise(mean.isel(lat=lat).values, offset, scale)
+            nc['std'][:, lat] = _quantise(std.isel(lat=lat).values, offset_std, scale_std)
+    return fn_out
+
+
+def decode_base_distribution(fn, varn='tas'):
+    """Open a compact base distribution and decode it to mean, perc, std.
+
+    The decoding is lazy (dask), so selecting a location only reads and
+    decodes the respective chunk. Time is kept numeric as for the float files.
+    """
+    ds = xr.open_dataset(fn, decode_times=False, mask_and_scale=False, chunks={})
+    scale, offset = ds.attrs['scale'], ds.attrs['offset']
+    scale_std, offset_std = ds.attrs['scale_std'], ds.attrs['offset_std']
+
+    q0 = ds['perc0'].astype(np.int32)
+    dq = ds['dperc'].astype(np.int32).cumsum('dpercentile').rename({'dpercentile': 'percentile'})
+    q = xr.concat([
+        q0.expand_dims(percentile=ds['percentile'].values[:1]),
+        q0 + dq.assign_coords(percentile=ds['percentile'].values[1:]),
+    ], dim='percentile')
+    missing = ds['perc0'] == _fill
+
+    perc = ((q + _nsteps // 2) * scale + offset).where(~missing)
+    mean = ((ds['mean'].astype(np.int32) + _nsteps // 2) * scale + offset).where(ds['mean'] != _fill)
+    std = ((ds['std'].astype(np.int32) + _nsteps // 2) * scale_std + offset_std).where(ds['std'] != _fill)
+    return mean.rename(varn), perc.rename(varn), std.rename(varn)
+
+
+def append_to_netcdf(ds, fn, dim='time'):
+    """Append `ds` along the (unlimited) dimension `dim` of the file `fn`.
+
+    Creates the file if it does not exist yet. Only variables containing
+    `dim` are appended, all other variables need to be identical.
+    """
+    if not os.path.isfile(fn):
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        ds.to_netcdf(fn, unlimited_dims=[dim])
+        return
+
+    with netCDF4.Dataset(fn, 'a') as nc:
+        missing = [varn for varn in ds.data_vars if dim in ds[varn].dims and varn not in nc.variables]
+        if len(missing) > 0:  # check before anything is written
+            raise ValueError(f'Variables {missing} not in {fn}')
+        start = nc.dimensions[dim].size
+        end = start + ds[dim].size
+        times = nc.variables[dim]
+        times[start:end], _, _ = xr.coding.times.encode_cf_datetime(
+            ds[dim].values, times.units, getattr(times, 'calendar', 'standard'))
+        for varn in ds.data_vars:
+            if dim not in ds[varn].dims:
+                continue
+            var = nc.variables[varn]
+            index = tuple(slice(start, end) if dd == dim else slice(None) for dd in var.dimensions)
+            var[index] = ds[varn].transpose(*var.dimensions).values
+
+
+def _write_bytes(data, fn):
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    with open(fn, 'wb') as ff:
+        ff.write(data)
+    return fn
+
+
+def save_async(data, fn):
+    """Write `data` (bytes) to `fn` in a background thread.
+
+    Returns a concurrent.futures.Future; call `wait_for_saves` before exiting
+    to make sure all files are written.
+    """
+    future = _writer.submit(_write_bytes, bytes(data), fn)
+    _pending_writes.append(future)
+    return future
+
+
+def wait_for_saves():
+    """Block until all files submitted with `save_async` are written."""
+    while _pending_writes:
+        _pending_writes.pop(0).result()
+
+
+def _day_key(time):
+    """Integer YYYYMMDD for each time step."""
+    return time.dt.year.values * 10000 + time.dt.month.values * 100 + time.dt.day.values
+
+
+def aggregate_hourly_to_daily(
+    fns_hourly,
+    fn_daily=fn_current,
+    varn='tas',
+    varn_hourly='t2m',
+    stats=('mean', ),
+    chunk_days=10,
+    steps_per_day=24,
+    rename={'valid_time': 'time', 'latitude': 'lat', 'longitude': 'lon'},
+):
+    """Stream hourly files into the daily store, appending only new days.
+
+    The hourly files are read in chunks of `chunk_days` days, so memory is
+    bounded by one chunk. The daily mean, minimum and maximum are written as
+    `varn`, `varn`min and `varn`max. The last day of each chunk is carried
+    over to the next one, as it might continue in the next chunk or file;
+    incomplete days at the end of the input are not written.
+
+    Parameters
+    ----------
+    fns_hourly : list of str
+        Hourly files, sorted in time after sorting the filenames.
+    fn_daily : str, by default fn_current
+        Daily store. Created if it does not exist; an existing store needs to
+        contain the variables of all `stats`.
+    stats : tuple of {'mean', 'min', 'max'}, by default ('mean', )
+        Daily statistics to write. The default matches the existing daily
+        files, which only contain `varn`.
+
+    Return
+    ------
+    int, number of days appended
+    """
+    varns = {'mean': varn, 'min': f'{varn}min', 'max': f'{varn}max'}
+    varns = {stat: varns[stat] for stat in stats}
+    last_day = -1
+    if os.path.isfile(fn_daily):
+        with open_dataset(fn_daily) as ds:
+            missing = [name for name in varns.values() if name not in ds.variables]
+            if len(missing) > 0:
+                raise ValueError(f'Variables {missing} not in {fn_daily}, select stats accordingly')
+            last_day = _day_key(ds['time'])[-1]
+
+    def write(da):
+        key = _day_key(da['time'])
+        da = da.isel(time=key > last_day)
+        if da['time'].size == 0:
+            return 0
+        daily = da.resample(time='1D')
+        ds = xr.Dataset({name: getattr(daily, stat)(keep_attrs=True) for stat, name in varns.items()})
+        first = list(varns.values())[0]
+        ds = ds.isel(time=ds[first].notnull().any([dim for dim in ds[first].dims if dim != 'time']))
+        append_to_netcdf(ds, fn_daily)
+        return ds['time'].size
+
+    ndays = 0
+    carry = None
+    for fn in sorted(fns_hourly):
+        ds = xr.open_dataset(fn, decode_times=False)
+        ds = ds.rename({key: value for key, value in rename.items() if key in ds.variables})
+        ds = _decode_standard_time(ds)
+        for idx in range(0, ds['time'].size, chunk_days * steps_per_day):
+            time = ds['time'].isel(time=slice(idx, idx + chunk_days * steps_per_day))
+            if carry is None and _day_key(time)[-1] <= last_day:
+                continue  # already in the daily store, do not read the data
+
+            chunk = ds[varn_hourly].isel(time=slice(idx, idx + chunk_days * steps_per_day))
+            chunk = chunk.reset_coords(drop=True).load()
+            if carry is not None:
+                chunk = xr.concat([carry, chunk], dim='time')
+            key = _day_key(chunk['time'])
+            carry = chunk.isel(time=key == key[-1])
+            ndays += write(chunk.isel(time=key != key[-1]))
+        ds.close()
+
+    if carry is not None and carry['time'].size == steps_per_day:
+        ndays += write(carry)
+    return ndays
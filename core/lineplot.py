@@ -2,47 +2,66 @@ import numpy as np
 import xarray as xr
 import matplotlib.pyplot as plt
 
+from core.climatology import Climatology, as_climatology
 from core.text import get_month_name
 from core.utilities import convert_to_doy
 
 
-def plot_timeseries_base(dpi_ratio=1, language='en'):
-    fig, ax = plt.subplots(
-            figsize=(12 / dpi_ratio, 6 / dpi_ratio), dpi=120*dpi_ratio
+def plot_timeseries_base(dpi_ratio=1, language='en', ncols=1):
+    """Set up the figure; for ncols > 1 side-by-side panels sharing the y-axis."""
+    fig, axes = plt.subplots(
+            1, ncols, sharey=True, squeeze=False,
+            figsize=((12 if ncols == 1 else 6 * ncols) / dpi_ratio, 6 / dpi_ratio), dpi=120*dpi_ratio
     )
-    ax.set_xlim(1, 365)
-    ax.set_xticks([1, 60, 121, 182, 243, 304, 365])
-
-    if language == 'en':
-        ax.set_ylabel("Temperature ($^\\circ$C)")
-        ax.set_xticklabels(["1. Jan.", "1. Mar.", "1. May", "1. Jul.", "1. Sep", "1. Nov.", "31. Dec."])
-    elif language == 'de':
-        ax.set_ylabel("Temperatur ($^\\circ$C)")
-        ax.set_xticklabels(["1. Jän.", "1. März", "1. Mai", "1. Jul.", "1. Sep", "1. Nov.", "31. Dez."])
-    else:
-        NotImplementedError
+    for idx, ax in enumerate(axes[0]):
+        ax.set_xlim(1, 365)
+        ax.set_xticks([1, 60, 121, 182, 243, 304, 365])
+
+        if language == 'en':
+            if idx == 0:
+                ax.set_ylabel("Temperature ($^\\circ$C)")
+            ax.set_xticklabels(["1. Jan.", "1. Mar.", "1. May", "1. Jul.", "1. Sep", "1. Nov.", "31. Dec."])
+        elif language == 'de':
+            if idx == 0:
+                ax.set_ylabel("Temperatur ($^\\circ$C)")
+            ax.set_xticklabels(["1. Jän.", "1. März", "1. Mai", "1. Jul.", "1. Sep", "1. Nov.", "31. Dez."])
+        else:
+            NotImplementedError
+
+        if idx < ncols - 1:  # the last label would overlap with the first of the next panel
+            ax.set_xticklabels([label.get_text() for label in ax.get_xticklabels()][:-1] + [''])
         
-    return fig, ax
+    if ncols == 1:
+        return fig, axes[0, 0]
+    return fig, axes[0]
       
 
 def plot_mean(ax, da, label='Mean'):
-    da = convert_to_doy(da)
+    if isinstance(da, Climatology):
+        doy, mean = da.dayofyear, da.mean
+    else:
+        da = convert_to_doy(da)
+        doy, mean = da['dayofyear'], da
     ax.plot(
-        da['dayofyear'],
-        da,
+        doy,
+        mean,
         color='k',
         label=label,
     )
     
 
 def plot_distribution(ax, da, percentiles=[(0, 100), (5, 95), (25, 75)], labels='auto'):
-    da = convert_to_doy(da)   
+    if isinstance(da, Climatology):
+        doy, get_percentile = da.dayofyear, da.percentile
+    else:
+        da = convert_to_doy(da)
+        doy, get_percentile = da['dayofyear'], lambda pp: da.sel(percentile=pp)
     
     for idx, pp in enumerate(percentiles):
         ax.fill_between(
-            da['dayofyear'],
-            da.sel(percentile=pp[0]),
-            da.sel(percentile=pp[1]),
+            doy,
+            get_percentile(pp[0]),
+            get_percentile(pp[1]),
             facecolor='k',
             edgecolor='none',
             alpha=.1#1/(len(percentiles) + 2),
@@ -77,43 +96,51 @@ def plot_year(ax, da, color='darkred', label=None, highlight_last=True, fill_bet
         )
 
     if fill_between is not None:
-        ref = convert_to_doy(fill_between)
+        if isinstance(fill_between, Climatology):
+            ref = fill_between.take('mean', da['dayofyear'].values)
+        else:
+            ref = convert_to_doy(fill_between).sel(dayofyear=da['dayofyear']).values
         ax.fill_between(
             da['dayofyear'],
             da,
-            ref.sel(dayofyear=da['dayofyear']),
-            where=da > ref.sel(dayofyear=da['dayofyear']),
+            ref,
+            where=da.values > ref,
             color='darkred',
             alpha=.2,
         )
         ax.fill_between(
             da['dayofyear'],
             da,
-            ref.sel(dayofyear=da['dayofyear']),
-            where=da < ref.sel(dayofyear=da['dayofyear']),
+            ref,
+            where=da.values < ref,
             color='darkblue',
             alpha=.2,
         )
             
 
 
-def plot_stats_last(ax, da, da_mean, da_perc, da_std, color='darkred', language='en'):
+def plot_stats_last(ax, da, da_mean, da_perc=None, da_std=None, color='darkred', language='en'):
+    """Annotate the last day with its anomaly.
+
+    `da_mean` can be a Climatology, in which case `da_perc` and `da_std` are
+    not needed.
+    """
     date_last = '{:02d}. {}'.format(
         da['time.day'][-1].item(), 
         get_month_name(da['time.month'][-1].item(), language=language),
         # da['time.year'][-1].item(),
     )
     
+    clim = as_climatology(da_mean, da_perc, da_std)
     da = convert_to_doy(da)
-    da_mean = convert_to_doy(da_mean)
-    da_perc = convert_to_doy(da_perc)
-    da_std = convert_to_doy(da_std)
+    doy = da['dayofyear'].values
+    values = da.values
     
-    doy_last = da['dayofyear'][-1].item()
+    doy_last = doy[-1].item()
     
-    da_last = da.sel(dayofyear=doy_last).item()
-    da_mean_last = da_mean.sel(dayofyear=doy_last).item()
-    da_std_last = da_std.sel(dayofyear=doy_last).item()
+    da_last = values[-1].item()
+    da_mean_last = clim.take('mean', doy_last).item()
+    da_std_last = clim.take('std', doy_last).item()
     anom = da_last - da_mean_last
     anom_std = anom / da_std_last
     text = f"{date_last}\n{anom:+.1f}$^\\circ$C\n{anom_std:+.1f} SD"
@@ -127,13 +154,13 @@ def plot_stats_last(ax, da, da_mean, da_perc, da_std, color='darkred', language=
     if doy_last > 335:
         if anom < 0:
             yy = np.min([
-                da.sel(dayofyear=doy_last) - 1,
-                da.sel(dayofyear=slice(330, None)).quantile(.1)])
+                da_last - 1,
+                np.quantile(values[doy >= 330], .1)])
             va = 'top' 
         else:
             yy = np.max([
-                da.sel(dayofyear=doy_last) + 1,
-                da.sel(dayofyear=slice(330, None)).quantile(.9)])
+                da_last + 1,
+                np.quantile(values[doy >= 330], .9)])
             va = 'bottom'        
 
     ax.text(
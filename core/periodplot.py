@@ -0,0 +1,120 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+from core.aggregation import seasons
+from core.text import get_month_name
+
+
+def plot_period_base(period='month', dpi_ratio=1, language='en'):
+    fig, ax = plt.subplots(
+            figsize=(12 / dpi_ratio, 6 / dpi_ratio), dpi=120*dpi_ratio
+    )
+    if period == 'month':
+        labels = [get_month_name(mm, language=language)[:3] for mm in range(1, 13)]
+    elif period == 'season':
+        labels = seasons
+    elif period == 'ytd':
+        labels = [{'en': 'Year to date', 'dt': 'Jahr bis dato'}[language]]
+    else:
+        raise NotImplementedError(period)
+    ax.set_xlim(-.5, len(labels) - .5)
+    ax.set_xticks(np.arange(len(labels)))
+    ax.set_xticklabels(labels)
+
+    if language == 'en':
+        ax.set_ylabel("Temperature ($^\\circ$C)")
+    elif language == 'dt':
+        ax.set_ylabel("Temperatur ($^\\circ$C)")
+    else:
+        raise NotImplementedError(language)
+
+    return fig, ax
+
+
+def plot_period_distribution(ax, base, percentiles=[(0, 100), (5, 95), (25, 75)], labels='auto'):
+    """Boxes of the base distribution of period means for each period.
+
+    Parameters
+    ----------
+    base : xr.DataArray, shape (years, periods)
+        Output of get_base_period_means for a single location.
+    """
+    xx = np.arange(base['period'].size)
+    for idx, pp in enumerate(percentiles):
+        lower, upper = base.quantile([pp[0] / 100, pp[1] / 100], 'year').values
+        ax.bar(
+            xx,
+            upper - lower,
+            bottom=lower,
+            width=.6,
+            facecolor='k',
+            edgecolor='none',
+            alpha=.1,
+        )
+        if labels is not None:
+            if labels == 'auto':
+                labels = ['{}-{}'.format(pp[0], pp[1]) for pp in percentiles]
+            ax.fill_between(
+                [], [], [],
+                facecolor='k', edgecolor='none',
+                alpha=.1*(idx+1),
+                label=labels[idx],
+            )
+
+
+def plot_period_mean(ax, base, label='Mean'):
+    ax.scatter(
+        np.arange(base['period'].size),
+        base.mean('year'),
+        marker='_',
+        s=400,
+        color='k',
+        label=label,
+    )
+
+
+def plot_period_current(ax, stats, year=None, color='darkred', label=None, annotate=True):
+    """Period means of one year with their anomaly.
+
+    Incomplete periods (e.g., the current month) are shown as open markers
+    without annotation.
+
+    Parameters
+    ----------
+    stats : dict
+        Output of get_period_statistics for a single location.
+    year : int, optional
+        Defaults to the last year.
+    """
+    current = stats['period mean']
+    if year is None:
+        year = current['year'][-1].item()
+    current = current.sel(year=year)
+    anom = stats['difference to mean'].sel(year=year).values
+    anom_std = stats['standard deviations to mean'].sel(year=year).values
+
+    xx = np.arange(current['period'].size)
+    complete = current['complete'].values
+    ax.scatter(
+        xx[complete], current.values[complete],
+        color=color, s=30, zorder=3, label=label,
+    )
+    ax.scatter(
+        xx[~complete], current.values[~complete],
+        facecolor='none', edgecolor=color, s=30, zorder=3,
+    )
+
+    if annotate:
+        for x, yy, aa, ss in zip(xx, current.values, anom, anom_std):
+            if np.isnan(yy) or np.isnan(aa):
+                continue
+            ax.text(
+                x + .1,
+                yy,
+                f"{aa:+.1f}$^\\circ$C\n{ss:+.1f} SD",
+                color=color,
+                ha='left',
+                va='center',
+                fontsize='small',
+                bbox=dict(facecolor="w", alpha=0.6, edgecolor="none"),
+            )
@@ -0,0 +1,32 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def prefetch(func, items, size=2, max_workers=2):
+    """Apply `func` to `items` in a thread pool, keeping up to `size` items ahead.
+
+    Yields (item, func(item)) in the order of `items`. While the caller works
+    on one result (e.g., rendering a figure), the next `size` items are
+    already evaluated in the background (e.g., loading data from disk), so
+    the total run time approaches max(load, render) instead of their sum.
+
+    Parameters
+    ----------
+    func : callable
+        Should be I/O bound or release the GIL (reading netCDF, numpy).
+    items : iterable
+    size : int, by default 2
+        Maximum number of items evaluated ahead of the one being consumed
+        (bounds memory use).
+    max_workers : int, by default 2
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        queue = deque()
+        for item in items:
+            queue.append((item, executor.submit(func, item)))
+            if len(queue) > size:
+                item, future = queue.popleft()
+                yield item, future.result()
+        while queue:
+            item, future = queue.popleft()
+            yield item, future.result()
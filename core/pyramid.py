@@ -0,0 +1,100 @@
+import os
+import subprocess
+import numpy as np
+from glob import glob
+
+from core.io import (
+    append_to_netcdf,
+    fn_base_pattern,
+    fn_current,
+    fn_past,
+    get_fn_raw,
+    open_dataset,
+    resolutions,
+)
+
+path_scripts = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cdo_cripts')
+
+
+def coarsen_area_weighted(da, factor):
+    """Coarsen `da` by `factor` grid cells in lat and lon, weighting by area.
+
+    Missing values are ignored. Incomplete blocks at the edges of the grid are
+    trimmed; the coordinates of the coarse grid are the block centres.
+    """
+    weights = np.cos(np.deg2rad(da['lat'])).where(da.notnull(), 0)
+    kwargs = {'lat': factor, 'lon': factor, 'boundary': 'trim'}
+    coarse = (da.fillna(0) * weights).coarsen(**kwargs).sum() / weights.coarsen(**kwargs).sum()
+    coarse.attrs = da.attrs
+    return coarse
+
+
+def coarsen_file(fn, fn_out, factor, varn='tas', chunk_size=365, overwrite=False):
+    """Write an area-weighted coarsened copy of `fn`, `chunk_size` time steps at a time."""
+    if os.path.isfile(fn_out):
+        if not overwrite:
+            return fn_out
+        os.remove(fn_out)
+
+    ds = open_dataset(fn)
+    for idx in range(0, ds['time'].size, chunk_size):
+        da = ds[varn].isel(time=slice(idx, idx + chunk_size)).load()
+        ds_out = coarsen_area_weighted(da, factor).to_dataset(name=varn)
+        ds_out.attrs = ds.attrs
+        append_to_netcdf(ds_out, fn_out)
+    ds.close()
+    return fn_out
+
+
+def build_pyramid(
+    varn='tas',
+    startyear_base=1940,
+    endyear_base=2024,
+    window_base=1,
+    levels=('0.5deg', '1deg', '2.5deg'),
+    dataset='era5',
+    overwrite=False,
+):
+    """Build coarsened levels of the raw data and the base statistics.
+
+    Only the raw data are coarsened (area-weighted). The base statistics of
+    each level are then calculated from the coarsened history with the
+    scripts in cdo_cripts: percentiles and standard deviations of area means
+    are not area means of the percentiles and standard deviations.
+
+    The coarse raw data are written to a sub-directory per level (see
+    `core.io.get_fn_raw`), the base statistics use the resolution field of
+    `fn_base_pattern`.
+    """
+    kwargs = dict(
+        dataset=dataset,
+        varn=varn,
+        window=window_base,
+        startyear=startyear_base,
+        endyear=endyear_base,
+        metric='*',
+    )
+    if window_base == 1:
+        script = [os.path.join(path_scripts, 'calculate_statistics_no_window.sh')]
+    else:
+        script = [os.path.join(path_scripts, 'calculate_statistics_running_window.sh'), '-w', str(window_base)]
+
+    for level in levels:
+        factor = int(round(resolutions[level] / resolutions['native']))
+        for fn in [fn_past, fn_current]:
+            coarsen_file(fn, get_fn_raw(fn, level), factor, varn=varn, overwrite=overwrite)
+
+        fn_base = fn_base_pattern.format(resolution=level, **kwargs)
+        if overwrite:
+            for fn in glob(fn_base):
+                os.remove(fn)
+        # the scripts skip statistics which already exist
+        subprocess.run(
+            script + [
+                '-s', str(startyear_base),
+                '-e', str(endyear_base),
+                get_fn_raw(fn_past, level),
+                os.path.dirname(fn_base),
+            ],
+            check=True,
+        )
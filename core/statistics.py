@@ -1,46 +1,84 @@
 import numpy as np
 import xarray as xr
 
-from core.utilities import convert_to_doy
+from core.climatology import Climatology, as_climatology
+from core.utilities import convert_to_doy, decode_time
 
 
 def get_percentile_band(da, da_perc):
     """Calculates percentile band for each day of the year.
 
-    For each day of the year (potentially from several years; untested),
-    calculate the percentile exceedances. Sum over exceedances: 
+    For each day (potentially from several years, e.g., the full record),
+    calculate the percentile exceedances of the respective day of the year. Sum over exceedances:
     - 0 means that even the minimum was never exceeded -> new cold extreme
     - len(perc) means that even the maximum was exceeded -> new heat extreme
 
     Parameters
     ----------
     da : xr.DataArray, shape (N)
-    da_perc : xr.DataArray (M,N)
+    da_perc : xr.DataArray (M,365) or Climatology
 
-    Return 
+    Return
     ------
     shape (N,2)
     """
-    da_perc = convert_to_doy(da_perc).load()
+    if isinstance(da_perc, Climatology):
+        perc, percentiles, dims = da_perc.perc, da_perc.percentiles, da_perc.dims
+    else:
+        da_perc = convert_to_doy(da_perc)
+        dims = [dim for dim in da_perc.dims if dim not in ['percentile', 'dayofyear']]
+        perc = da_perc.transpose('percentile', 'dayofyear', *dims).values.astype(float)
+        percentiles = da_perc['percentile'].values
+    da = da.transpose('time', *dims)
+
+    _, doy = decode_time(da['time'])
+    idx = doy - 1  # leap days get -1
+    valid = (idx >= 0) & (idx < perc.shape[1])
+    perc_day = perc[:, np.where(valid, idx, 0)]  # fancy indexing returns a copy
     # lower lowest bound ever so slightly to avoid new cold records in-sample
-    da_perc.values[0, :] -= 1.e-5
-    return xr.apply_ufunc(
-        lambda pp: np.array([
-            da_perc['percentile'][pp-1].item() if pp > 0 else -999, 
-            da_perc['percentile'][pp].item() if pp < da_perc['percentile'].size else 999]),
-        (da.groupby('time.dayofyear') > da_perc.load()).sum('percentile'),
-        output_core_dims=[['bounds']],
-        vectorize=True,
+    perc_day[0] -= 1.e-5
+
+    nexceed = (da.values > perc_day).sum(axis=0)
+    bounds = np.stack([
+        np.where(nexceed > 0, percentiles[np.maximum(nexceed - 1, 0)], -999),
+        np.where(nexceed < percentiles.size, percentiles[np.minimum(nexceed, percentiles.size - 1)], 999),
+    ], axis=-1)
+    if not valid.all():  # no base values for these days (e.g., 31. Dec. in leap years)
+        bounds = bounds.astype(float)
+        bounds[~valid] = np.nan
+
+    return xr.DataArray(
+        bounds,
+        dims=da.dims + ('bounds', ),
+        coords=da.coords,
     )
 
 
-def get_statistics(da, da_mean, da_perc, da_std):
-    da_mean = convert_to_doy(da_mean)
-    da_perc = convert_to_doy(da_perc)
-    da_std = convert_to_doy(da_std)
-    
+def get_statistics(da, da_mean, da_perc=None, da_std=None):
+    """Anomalies and percentile band of `da` relative to the base distribution.
+
+    `da_mean` can be a Climatology, in which case `da_perc` and `da_std` are
+    not needed.
+    """
+    clim = as_climatology(da_mean, da_perc, da_std)
+    da = da.transpose('time', *clim.dims)
+    _, doy = decode_time(da['time'])
+
+    anom = da - clim.take('mean', doy)
     return {
-        'difference to mean': da.groupby('time.dayofyear') - da_mean,
-        'standard deviations to mean': (da.groupby('time.dayofyear') - da_mean).groupby('time.dayofyear') / da_std,
-        'percentile band': get_percentile_band(da, da_perc),
-    }
\ No newline at end of file
+        'difference to mean': anom,
+        'standard deviations to mean': anom / clim.take('std', doy),
+        'percentile band': get_percentile_band(da, clim),
+    }
+
+
+def get_percentile_rank(band):
+    """Convert the percentile band to a single rank (centre of the band).
+
+    New cold (heat) records, i.e., days below (above) the base minimum
+    (maximum), get a rank of -5 (105).
+    """
+    lower, upper = band.isel(bounds=0), band.isel(bounds=1)
+    rank = (lower + upper) / 2
+    rank = rank.where(lower != -999, -5)
+    return rank.where(upper != 999, 105)
@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import xarray as xr
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
@@ -31,17 +32,90 @@ def get_date_str(info, format_='%a %d. %b %Y', language=None):
             'Sun', 'So')
     
 
+# day of year (365-day convention) before the first day of each month
+_month_start = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+_unit_seconds = {'days': 86400, 'hours': 3600, 'minutes': 60, 'seconds': 1}
+standard_calendars = ['standard', 'gregorian', 'proleptic_gregorian']
+
+
+def _dayofyear_365(month, day):
+    return np.where((month == 2) & (day == 29), 0, _month_start[month - 1] + day)
+
+
+def _parse_reference_date(reference):
+    """Split 'YYYY-M-D[( |T)hh:mm:ss][ timezone]' into year, month, day and seconds."""
+    reference = reference.strip()
+    split = min([idx for idx in [reference.find('T'), reference.find(' ')] if idx >= 0], default=len(reference))
+    date, clock = reference[:split], reference[split + 1:].strip()
+    clock = clock.split(' ')[0].rstrip('Z')  # drop the time zone (e.g., 'UTC')
+    if not clock[:1].isdigit():  # only a time zone
+        clock = ''
+    year, month, day = map(int, date.split('-'))
+    seconds = sum(
+        float(value) * factor for value, factor in zip(clock.strip().split(':'), [3600, 60, 1]) if value)
+    return year, month, day, int(seconds)
+
+
+def decode_time(time):
+    """Decode time to integer year and day-of-year arrays (365-day convention).
+
+    Vectorised for datetime64 values and for undecoded numeric values (opened
+    with decode_times=False, 'units' and 'calendar' in the attributes), i.e.,
+    without creating cftime objects. Other values (e.g., cftime objects) fall
+    back to the slower .dt accessor.
+
+    In the 365-day convention 1. Mar. is always day 60. Leap days (29. Feb.)
+    have no day of year and get 0.
+
+    Parameters
+    ----------
+    time : xr.DataArray, shape (N)
+
+    Return
+    ------
+    year, dayofyear : np.ndarray of int, shape (N)
+    """
+    values = time.values
+    if np.issubdtype(values.dtype, np.datetime64):
+        years = values.astype('datetime64[Y]')
+        months = values.astype('datetime64[M]')
+        month = (months - years).astype(int) + 1
+        day = (values.astype('datetime64[D]') - months).astype(int) + 1
+        return years.astype(int) + 1970, _dayofyear_365(month, day)
+
+    if np.issubdtype(values.dtype, np.number) and 'units' in time.attrs:
+        units, reference = time.attrs['units'].split(' since ')
+        calendar = time.attrs.get('calendar', 'standard').lower()
+        year, month, day, offset = _parse_reference_date(reference)
+        seconds = np.round(values * _unit_seconds[units.strip()]).astype(np.int64) + offset
+        if calendar in ['365_day', 'noleap']:
+            days = seconds // 86400 + _month_start[month - 1] + day - 1
+            return year + days // 365, days % 365 + 1
+        if calendar in standard_calendars:
+            reference = np.datetime64('{:04d}-{:02d}-{:02d}'.format(year, month, day), 's')
+            return decode_time(xr.DataArray(reference + seconds.astype('timedelta64[s]')))
+
+    return time.dt.year.values, _dayofyear_365(time.dt.month.values, time.dt.day.values)
+
+
+def drop_leap_days(da):
+    """Delete 29. Feb. (e.g., to be consistent with the base distributions)."""
+    _, doy = decode_time(da['time'])
+    return da.isel(time=doy != 0)
+
+
 def delete_last_day_leap_year(da: xr.DataArray) -> xr.DataArray:
-    return da.where(da["dayofyear"] != 366, drop=True)
+    return da.isel(dayofyear=(da["dayofyear"].values >= 1) & (da["dayofyear"].values <= 365))
 
 
 def convert_to_doy(da, delete_leap_days=True):
     if 'time' in da.dims:
-        try:
-            da = da.assign_coords(time=da['time.dayofyear']) 
-        except AttributeError:
-            pass
-        da = da.rename({'time': 'dayofyear'})
+        time = da['time']
+        if np.issubdtype(time.dtype, np.number) and 'units' not in time.attrs:
+            doy = time.values  # already day of year
+        else:
+            _, doy = decode_time(time)
+        da = da.assign_coords(time=doy).rename({'time': 'dayofyear'})
     elif 'dayofyear' in da.dims:
         pass
     else:
@@ -51,6 +125,32 @@ def convert_to_doy(da, delete_leap_days=True):
     return da
 
 
+def to_year_doy(da):
+    """Reshape a daily time series to (year, dayofyear) in the 365-day convention.
+
+    Missing days are NaN, leap days are dropped. Additional dimensions (e.g.,
+    bounds) are kept as trailing dimensions.
+    """
+    da = da.transpose('time', ...)
+    year, doy = decode_time(da['time'])
+    da, year, doy = da.isel(time=doy != 0), year[doy != 0], doy[doy != 0]
+
+    years = np.arange(year.min(), year.max() + 1)
+    values = np.full((years.size, 365) + da.shape[1:], np.nan)
+    values[year - years[0], doy - 1] = da.values
+    return xr.DataArray(
+        values,
+        dims=('year', 'dayofyear') + da.dims[1:],
+        coords={
+            'year': years,
+            'dayofyear': np.arange(1, 366),
+            **{dim: da[dim] for dim in da.dims[1:] if dim in da.coords},
+        },
+        name=da.name,
+        attrs=da.attrs,
+    )
+
+
 def add_license(ax: plt.Axes) -> None:
     """Add a license to the plot."""
 
@@ -8,13 +8,26 @@ Summary: Runscript to calculate a lineplot for a given day and location.
 """
 import argparse
 import os
+from io import BytesIO
 import numpy as np
 import xarray as xr
 import matplotlib.pyplot as plt
 from datetime import datetime
-
-from core.io import fn_base_pattern, fn_current, fn_past
-from core.statistics import get_statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from core.climatology import Climatology
+from core.io import (
+    fn_base_pattern,
+    fn_current,
+    fn_past,
+    get_fn_raw,
+    open_base_distribution,
+    open_dataset,
+    save_async,
+    select_resolution,
+)
+from core.pipeline import prefetch
+from core.statistics import get_percentile_rank, get_statistics
 from core.lineplot import (
     plot_timeseries_base,
     plot_distribution,
@@ -22,6 +35,10 @@ from core.lineplot import (
     plot_year,
     plot_stats_last,
 )
+from core.calendarplot import (
+    plot_calendar_base,
+    plot_calendar,
+)
 from core.barplot import (
     plot_histogram_base,
     plot_histogram,
@@ -33,7 +50,9 @@ from core.utilities import (
     add_license, 
     convert_to_doy, 
     get_date_str,
+    drop_leap_days,
     get_location_coordinates,
+    to_year_doy,
 )
 
 
@@ -105,6 +124,17 @@ def read_input():
         help="Window size of the base period.",
     )
 
+    parser.add_argument(
+        "--base-period",
+        dest="base_periods",
+        default=None,
+        action="append",
+        nargs=3,
+        type=int,
+        metavar=("STARTYEAR", "ENDYEAR", "WINDOW"),
+        help="Compare against several base periods (can be given multiple times). Overwrites the options above.",
+    )
+
     parser.add_argument(
         "--language",
         dest="language",
@@ -132,27 +162,70 @@ def read_input():
     return dd
 
 
-def main_lineplot(
+def save_figure(fullpath, save=True, overwrite=False, buffer=False):
+    """Save the current figure to disk and/or encode it in memory.
+
+    If buffer is True, the PNG is rendered into a BytesIO object which is
+    returned and archived to `fullpath` in the background (if save is True).
+    Otherwise the figure is written directly and `fullpath` is returned.
+    """
+    if not buffer:
+        if save and (not os.path.isfile(fullpath) or overwrite):
+            plt.savefig(fullpath, dpi=120)
+        return fullpath
+
+    buf = BytesIO()
+    plt.savefig(buf, format='png', dpi=120)
+    buf.seek(0)
+    if save and (not os.path.isfile(fullpath) or overwrite):
+        save_async(buf.getvalue(), fullpath)
+    return buf
+
+
+def get_resolution(
+    resolution='native',
     location={'Hamburg': {'lat': 53, 'lon': 10}},
+    varn='tas',
+    startyear_base=1940,
+    endyear_base=2024,
+    window_base=1,
+    **kwargs
+):
+    """Resolve resolution 'auto' to the coarsest level sufficient for `location`.
+
+    Point locations always use the native grid, regions
+    ({'lat': (south, north), 'lon': (west, east)}) the coarsest level for which
+    the raw data and the base distribution exist (see core.io.select_resolution).
+    """
+    if resolution != 'auto':
+        return resolution
+    return select_resolution(
+        region=list(location.values())[0],
+        fn=lambda level: [
+            get_fn_raw(fn_past, level),
+            get_fn_raw(fn_current, level),
+            fn_base_pattern.format(
+                dataset='era5',
+                resolution=level,
+                varn=varn,
+                window=window_base,
+                startyear=startyear_base,
+                endyear=endyear_base,
+                metric='ydrunmean',
+            ),
+        ],
+    )
+
+
+def open_series(
     varn='tas',
     enddate=None,  # raise Error if not in dataset?
     fn=None,
     year=None,
-    language='en',
-
-    startyear_base = 1940,
-    endyear_base = 2024,
-    window_base = 1,
-    
-    save=True,
-    overwrite=False,
-    show=True,
+    resolution='native',
+    **kwargs
 ):
-    if not show and not save:
-        print('Either save or show need to be True')
-        return None, None
-        
-    # --- load data to evaluate ---
+    """Open the observed series lazily, only selecting the time steps."""
     if fn is None:    
         if year is None:
             fn = fn_current
@@ -161,7 +234,7 @@ def main_lineplot(
         else:
             fn = fn_past
            
-    da = xr.open_dataset(os.path.join(fn), use_cftime=True)[varn] 
+    da = open_dataset(get_fn_raw(fn, resolution))[varn] 
     
     if year is not None:
         da = da.sel(time=str(year))
@@ -177,67 +250,153 @@ def main_lineplot(
     if da['time'].size == 0:
         raise ValueError('No time steps selected')
 
-    loc = list(location.keys())[0]
-    date = [
+    # delete Feb 29th for past years to be consistent with percentile calculation
+    # and not have new heat records in sample, which does not make sense
+    if fn == fn_past:
+        da = drop_leap_days(da)
+    return da
+
+
+def load_location(da, location={'Hamburg': {'lat': 53, 'lon': 10}}):
+    """Load the series opened by open_series at one location (in degC)."""
+    da = da.sel(**list(location.values())[0], method='nearest').load()
+    if da.isel(time=0) > 100:
+        da -= 273.15
+    return da
+
+
+def load_series(location={'Hamburg': {'lat': 53, 'lon': 10}}, **kwargs):
+    """Load the observed series of one location (in degC)."""
+    return load_location(open_series(**kwargs), location)
+
+
+def load_record(
+    location={'Hamburg': {'lat': 53, 'lon': 10}},
+    varn='tas',
+    startyear=None,
+    endyear=None,
+    include_current=True,
+    resolution='native',
+    **kwargs
+):
+    """Load the full observed record of one location (in degC, 365-day calendar)."""
+    das = []
+    for fn in [fn_past, fn_current] if include_current else [fn_past]:
+        da = open_dataset(get_fn_raw(fn, resolution))[varn]
+        da = da.sel(**list(location.values())[0], method='nearest')
+        da = da.sel(time=slice(
+            None if startyear is None else str(startyear),
+            None if endyear is None else str(endyear),
+        )).load()
+        # delete Feb 29th to be consistent with percentile calculation
+        das.append(drop_leap_days(da))
+    da = xr.concat(das, dim='time')
+    # the current year might also be contained in the record
+    da = da.isel(time=np.unique(da['time'].values, return_index=True)[1])
+
+    if da['time'].size == 0:
+        raise ValueError('No time steps selected')
+    if da.isel(time=0) > 100:
+        da -= 273.15
+    return da
+
+
+def load_climatology(
+    location={'Hamburg': {'lat': 53, 'lon': 10}},
+    varn='tas',
+    startyear_base = 1940,
+    endyear_base = 2024,
+    window_base = 1,
+    resolution='native',
+    **kwargs
+):
+    """Load the base distribution of one location as Climatology (in degC)."""
+    mean, perc, std = open_base_distribution(
+        varn=varn,
+        startyear_base=startyear_base,
+        endyear_base=endyear_base,
+        window_base=window_base,
+        resolution=resolution,
+    )
+       
+    perc = perc.sel(**list(location.values())[0], method='nearest').load()
+    std = std.sel(**list(location.values())[0], method='nearest').load()
+    mean = mean.sel(**list(location.values())[0], method='nearest').load()
+
+    if mean.isel(time=0) > 100:
+        mean = mean - 273.15
+        perc = perc - 273.15
+
+    # convert base distribution to day-of-year arrays once
+    return Climatology.from_dataarrays(mean, perc, std)
+
+
+def get_date(da):
+    return [
         str(da['time.year'][-1].item()), 
         '{:02d}'.format(da['time.month'][-1].item()), 
         '{:02d}'.format(da['time.day'][-1].item())
     ]
 
-    path = f'figures/{loc}/{date[0]}/{varn}/b{startyear_base}-{endyear_base}_w{window_base}/{language}/timeseries'
+
+def get_lineplot_path(
+    location,
+    date,
+    varn='tas',
+    language='en',
+    startyear_base = 1940,
+    endyear_base = 2024,
+    window_base = 1,
+    base_periods=None,
+    **kwargs
+):
+    loc = list(location.keys())[0]
+    if base_periods is None:
+        base_periods = [(startyear_base, endyear_base, window_base)]
+    base = '_'.join('b{}-{}_w{}'.format(*base_period) for base_period in base_periods)
+    path = f'figures/{loc}/{date[0]}/{varn}/{base}/{language}/timeseries'
     os.makedirs(path, exist_ok=True)
-    fullpath = os.path.join(
+    return os.path.join(
         path,
-        'timeseries_b{startyear_base}-{endyear_base}_w{window_base}_{location}_{date}.png'.format(
-            startyear_base=startyear_base, 
-            endyear_base=endyear_base, 
-            window_base=window_base,
+        'timeseries_{base}_{location}_{date}.png'.format(
+            base=base,
             location=loc, 
             date='-'.join(date)),
     )
-    if save and not show and os.path.isfile(fullpath) and not overwrite:
-        return fullpath, None
-    
-    # --- load base distribution ---
-    fn_base = fn_base_pattern.format(
-        dataset='era5',
-        resolution='native',
-        varn=varn,
-        window=window_base,
-        startyear=startyear_base,
-        endyear=endyear_base,
-        metric='{}',
-    )
-    
-    mean = xr.open_dataset(fn_base.format('ydrunmean'), use_cftime=True)[varn]
-    std = xr.open_dataset(fn_base.format('std'), use_cftime=True)[varn]
-    
-    perc = xr.open_mfdataset(
-        fn_base.format('p*'),
-        use_cftime=True,
-        combine='nested', 
-        concat_dim='percentile', 
-        preprocess=lambda x: x.expand_dims({'percentile': [int(x.attrs['percentile'])]})
-        )[varn]
-    perc = perc.sortby('percentile')
-       
-    perc = perc.sel(**list(location.values())[0], method='nearest').load()
-    std = std.sel(**list(location.values())[0], method='nearest').load()
-    mean = mean.sel(**list(location.values())[0], method='nearest').load()
-    da = da.sel(**list(location.values())[0], method='nearest').load()
 
-    if da.isel(time=0) > 100:
-        mean -= 273.15
-        perc -= 273.15
-        da -= 273.15
 
+def draw_lineplot(ax, da, clim, startyear_base, endyear_base, language='en'):
+    plot_distribution(ax, clim, labels=['Min-Max', '90%', '50%'])
+    plot_mean(ax, clim)  
+    add_license(ax)
+    legend = ax.legend(title='{}-{}'.format(startyear_base, endyear_base))
+        
+    plot_year(ax, da, fill_between=clim)
+    plot_stats_last(ax, da, clim, language=language)
+
+
+def render_lineplot(
+    da,
+    clim,
+    fullpath,
+    location={'Hamburg': {'lat': 53, 'lon': 10}},
+    varn='tas',
+    language='en',
+
+    startyear_base = 1940,
+    endyear_base = 2024,
+    window_base = 1,
     
-    # delete Feb 29th for past years to be consistent with percentile calculation
-    # and not have new heat records in sample, which does not make sense
-    if fn == fn_past:
-        da = da.convert_calendar('365_day')  
+    save=True,
+    overwrite=False,
+    show=True,
+    buffer=False,
+    **kwargs
+):
+    """Plot the observed series against the climatology and calculate statistics."""
+    loc = list(location.keys())[0]
+    date = get_date(da)
 
-    # --- plot ---
     fig, ax = plot_timeseries_base(language=language)
     ax.set_title('{year}: {loc} {varn}'.format(
         year=date[0], 
@@ -245,15 +404,9 @@ def main_lineplot(
         varn=varn_map(varn, language=language),
     ))
     fig.subplots_adjust(left=.06, right=.96, bottom=.05, top=.95)
-    plot_distribution(ax, perc, labels=['Min-Max', '90%', '50%'])
-    plot_mean(ax, mean)  
-    add_license(ax)
-    legend = ax.legend(title='{}-{}'.format(startyear_base, endyear_base))
-        
-    plot_year(ax, da, fill_between=mean)
-    plot_stats_last(ax, da, mean, perc, std, language=language)
+    draw_lineplot(ax, da, clim, startyear_base, endyear_base, language=language)
 
-    info = get_statistics(da, mean, perc, std)
+    info = get_statistics(da, clim)
     info['metadata'] = {
         'varn': varn,
         'location': location,
@@ -264,12 +417,310 @@ def main_lineplot(
         'language': language,
     }
 
-    if save and (not os.path.isfile(fullpath) or overwrite):
-        plt.savefig(fullpath, dpi=120)
+    out = save_figure(fullpath, save=save, overwrite=overwrite, buffer=buffer)
     if not show:
         plt.close()
         
-    return fullpath, info
+    return out, info
+
+
+def render_lineplot_multibase(
+    da,
+    clims,
+    base_periods,
+    fullpath,
+    location={'Hamburg': {'lat': 53, 'lon': 10}},
+    varn='tas',
+    language='en',
+
+    save=True,
+    overwrite=False,
+    show=True,
+    buffer=False,
+    **kwargs
+):
+    """Side-by-side panels of the observed series against several base periods.
+
+    Statistics for all base periods are calculated in one batch by stacking
+    the climatologies along a 'base' dimension.
+    """
+    loc = list(location.keys())[0]
+    date = get_date(da)
+
+    fig, axes = plot_timeseries_base(language=language, ncols=len(base_periods))
+    fig.suptitle('{year}: {loc} {varn}'.format(
+        year=date[0], 
+        loc=loc,
+        varn=varn_map(varn, language=language),
+    ))
+    fig.subplots_adjust(left=.06, right=.98, bottom=.05, top=.92, wspace=.1)
+    for ax, clim, (startyear_base, endyear_base, window_base) in zip(axes, clims, base_periods):
+        draw_lineplot(ax, da, clim, startyear_base, endyear_base, language=language)
+
+    stats = get_statistics(
+        da.expand_dims(base=len(base_periods), axis=-1),
+        Climatology.stack(clims, dim='base'),
+    )
+    infos = []
+    for idx, (startyear_base, endyear_base, window_base) in enumerate(base_periods):
+        info = {key: value.isel(base=idx) for key, value in stats.items()}
+        info['metadata'] = {
+            'varn': varn,
+            'location': location,
+            'date': date,
+            'startyear_base': startyear_base,
+            'endyear_base': endyear_base,
+            'window_base': window_base,
+            'language': language,
+        }
+        infos.append(info)
+
+    out = save_figure(fullpath, save=save, overwrite=overwrite, buffer=buffer)
+    if not show:
+        plt.close()
+
+    return out, infos
+
+
+def main_lineplot(
+    location={'Hamburg': {'lat': 53, 'lon': 10}},
+    varn='tas',
+    enddate=None,  # raise Error if not in dataset?
+    fn=None,
+    year=None,
+    language='en',
+
+    startyear_base = 1940,
+    endyear_base = 2024,
+    window_base = 1,
+    base_periods=None,
+    resolution='native',
+    
+    save=True,
+    overwrite=False,
+    show=True,
+    buffer=False,
+):
+    """Plot the given year against the base distribution.
+
+    If `base_periods` is given as a list of (startyear_base, endyear_base,
+    window_base) it replaces the scalar base period arguments. The
+    observations are then loaded once, all base periods are loaded
+    concurrently, and a combined figure plus a list of `info` (one per base
+    period) is returned.
+
+    Use resolution='auto' to select the resolution level with get_resolution.
+    """
+    if not show and not save and not buffer:
+        print('Either save, show, or buffer need to be True')
+        return None, None
+    kwargs = dict(
+        location=location,
+        varn=varn,
+        enddate=enddate,
+        fn=fn,
+        year=year,
+        language=language,
+        startyear_base=startyear_base,
+        endyear_base=endyear_base,
+        window_base=window_base,
+        resolution=resolution,
+        save=save,
+        overwrite=overwrite,
+        show=show,
+        buffer=buffer,
+    )
+    kwargs['resolution'] = get_resolution(**kwargs)
+        
+    # --- open data to evaluate (only the time axis is read for the file check) ---
+    da = open_series(**kwargs)
+
+    if base_periods is not None:
+        base_periods = [tuple(base_period) for base_period in base_periods]
+        fullpath = get_lineplot_path(date=get_date(da), base_periods=base_periods, **kwargs)
+        if save and not show and not buffer and os.path.isfile(fullpath) and not overwrite:
+            return fullpath, None
+        da = load_location(da, location)
+
+        def load(base_period):
+            startyear_base, endyear_base, window_base = base_period
+            return load_climatology(**{
+                **kwargs,
+                'startyear_base': startyear_base,
+                'endyear_base': endyear_base,
+                'window_base': window_base,
+            })
+
+        with ThreadPoolExecutor(max_workers=len(base_periods)) as executor:
+            clims = list(executor.map(load, base_periods))
+        return render_lineplot_multibase(da, clims, base_periods, fullpath, **kwargs)
+
+    fullpath = get_lineplot_path(date=get_date(da), **kwargs)
+    if save and not show and not buffer and os.path.isfile(fullpath) and not overwrite:
+        return fullpath, None
+    da = load_location(da, location)
+    
+    # --- load base distribution ---
+    clim = load_climatology(**kwargs)
+
+    # --- plot ---
+    return render_lineplot(da, clim, fullpath, **kwargs)
+
+
+def main_lineplots(tasks, prefetch_size=2, max_workers=2, **kwargs):
+    """Run main_lineplot for several locations and/or dates.
+
+    Data for the next `prefetch_size` tasks are loaded in a thread pool while
+    the current one is rendered (matplotlib stays in the main thread). As in
+    main_lineplot, existing figures are skipped unless `overwrite` is True
+    (and neither `show` nor `buffer` is set). Figures are shown and closed
+    after each task.
+
+    Parameters
+    ----------
+    tasks : list of dict
+        Arguments of main_lineplot which differ between tasks, e.g.,
+        [{'location': {...}, 'enddate': '2025-03-01'}, ...]
+    kwargs : dict
+        Arguments of main_lineplot shared by all tasks.
+
+    Return
+    ------
+    list of (fullpath or buffer, info)
+    """
+    def load(task):
+        task = {**kwargs, **task}
+        task['resolution'] = get_resolution(**task)
+        da = open_series(**task)
+        fullpath = get_lineplot_path(date=get_date(da), **task)
+        if (
+            task.get('save', True)
+            and not task.get('show', True)
+            and not task.get('buffer', False)
+            and os.path.isfile(fullpath)
+            and not task.get('overwrite', False)
+        ):
+            return fullpath, None, None
+        return fullpath, load_location(da, task['location']), load_climatology(**task)
+
+    results = []
+    for task, (fullpath, da, clim) in prefetch(load, tasks, size=prefetch_size, max_workers=max_workers):
+        if da is None:
+            results.append((fullpath, None))
+            continue
+        task = {**kwargs, **task}
+        results.append(render_lineplot(da, clim, fullpath, **task))
+        if task.get('show', True):
+            plt.show()
+            plt.close()
+    return results
+
+
+def main_calendarplot(
+    location={'Hamburg': {'lat': 53, 'lon': 10}},
+    varn='tas',
+    metric='percentile band',
+    startyear=None,
+    endyear=None,
+    include_current=True,
+    language='en',
+
+    startyear_base = 1940,
+    endyear_base = 2024,
+    window_base = 1,
+    resolution='native',
+
+    save=True,
+    overwrite=False,
+    show=True,
+    buffer=False,
+):
+    """Calendar (year by day of year) of the full record of one location.
+
+    Anomalies and percentile bands of all days are calculated in one
+    vectorised pass.
+
+    Parameters
+    ----------
+    metric : {'percentile band', 'difference to mean', 'standard deviations to mean'}
+    """
+    if not show and not save and not buffer:
+        print('Either save, show, or buffer need to be True')
+        return None, None
+    kwargs = dict(
+        location=location,
+        varn=varn,
+        startyear=startyear,
+        endyear=endyear,
+        include_current=include_current,
+        startyear_base=startyear_base,
+        endyear_base=endyear_base,
+        window_base=window_base,
+        resolution=resolution,
+    )
+    kwargs['resolution'] = get_resolution(**kwargs)
+
+    da = load_record(**kwargs)
+    clim = load_climatology(**kwargs)
+    info = get_statistics(da, clim)
+    startyear, endyear = da['time.year'][0].item(), da['time.year'][-1].item()
+    date = get_date(da)
+    info['metadata'] = {
+        'varn': varn,
+        'location': location,
+        'date': date,
+        'startyear_base': startyear_base,
+        'endyear_base': endyear_base,
+        'window_base': window_base,
+        'language': language,
+    }
+
+    loc = list(location.keys())[0]
+    path = f'figures/{loc}/all/{varn}/b{startyear_base}-{endyear_base}_w{window_base}/{language}/calendar'
+    os.makedirs(path, exist_ok=True)
+    fullpath = os.path.join(
+        path,
+        'calendar_{metric}_b{startyear_base}-{endyear_base}_w{window_base}_{location}_{startyear}-{date}.png'.format(
+            metric=metric.replace(' ', '-'),
+            startyear_base=startyear_base,
+            endyear_base=endyear_base,
+            window_base=window_base,
+            location=loc,
+            startyear=startyear,
+            date='-'.join(date)),
+    )
+    if save and not show and not buffer and os.path.isfile(fullpath) and not overwrite:
+        return fullpath, info
+
+    if metric == 'percentile band':
+        values = get_percentile_rank(info[metric])
+        plot_kwargs = dict(cmap='RdBu_r', vmin=-5, vmax=105, label={
+            'en': '{}-{} percentile'.format(startyear_base, endyear_base),
+            'dt': '{}-{} Perzentile'.format(startyear_base, endyear_base)}[language])
+    elif metric == 'difference to mean':
+        values = info[metric]
+        plot_kwargs = dict(label={'en': 'Anomaly ($^\\circ$C)', 'dt': 'Anomalie ($^\\circ$C)'}[language])
+    elif metric == 'standard deviations to mean':
+        values = info[metric]
+        plot_kwargs = dict(label={'en': 'Anomaly (SD)', 'dt': 'Anomalie (SD)'}[language])
+    else:
+        raise NotImplementedError(metric)
+
+    fig, ax = plot_calendar_base(startyear, endyear, language=language)
+    ax.set_title('{startyear}-{endyear}: {loc} {varn}'.format(
+        startyear=startyear,
+        endyear=endyear,
+        loc=loc,
+        varn=varn_map(varn, language=language),
+    ))
+    plot_calendar(ax, to_year_doy(values), **plot_kwargs)
+    add_license(ax)
+
+    out = save_figure(fullpath, save=save, overwrite=overwrite, buffer=buffer)
+    if not show:
+        plt.close()
+
+    return out, info
 
 
 def main_barplot(
@@ -278,6 +729,7 @@ def main_barplot(
     save=True,
     overwrite=False,
     show=True,
+    buffer=False,
 
     **kwargs
 ):
@@ -305,7 +757,7 @@ def main_barplot(
             location=loc,
             date='-'.join(info['metadata']['date'])))
     
-    if save and not show and os.path.isfile(fullpath) and not overwrite:
+    if save and not show and not buffer and os.path.isfile(fullpath) and not overwrite:
         return None
 
     fig, ax = plot_histogram_base(
@@ -320,7 +772,7 @@ def main_barplot(
         text2={'en': '1. Jan until {}', 'dt': '1. Jan bis {}'}[language].format(get_date_str(info, "%d. %b %Y"))))
     
     bins, counts = np.unique(
-        info['percentile band'],
+        info['percentile band'].dropna('time'),  # no base values on leap days
         return_counts=True,
         axis=0,
     )
@@ -331,16 +783,16 @@ def main_barplot(
     )
     add_license(ax)
 
-    if save and (not os.path.isfile(fullpath) or overwrite):
-        plt.savefig(fullpath, dpi=120)
+    out = save_figure(fullpath, save=save, overwrite=overwrite, buffer=buffer)
     if not show:
         plt.close()
         
-    return fullpath
+    return out
     
 
 if __name__ == '__main__':
     input_ = read_input()
     fn, info = main_lineplot(**input_)
-    main_barplot(info, **input_)
+    for info_ in info if isinstance(info, list) else [info]:
+        main_barplot(info_, **input_)
     
\ No newline at end of file
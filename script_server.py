@@ -0,0 +1,254 @@
+#!/home/b/b381815/miniconda3/envs/py/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+(c) by Lukas Brunner (lukas.brunner@uni-hamburg.de) 2024 under a MIT License (https://mit-license.org)
+
+Summary: Local HTTP service returning figures and statistics on demand.
+
+Endpoints (all GET, parameters as query string):
+    /lineplot  PNG of the timeseries (see script_main.main_lineplot)
+    /barplot   PNG of the histogram (see script_main.main_barplot)
+    /info      JSON with the statistics of all days
+
+Parameters:
+    location        Location name (required)
+    lat, lon        Coordinates, can be skipped if the location is in the database
+    date            Plot until this date (YYYY-MM-DD), defaults to the last available day
+    language        'en' or 'dt'
+    startyear_base, endyear_base, window_base
+
+Example:
+    curl "http://localhost:8080/lineplot?location=Hamburg&date=2025-03-01" > figure.png
+"""
+import argparse
+import json
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+import matplotlib
+matplotlib.use('Agg')
+
+from core.io import fn_current, open_base_distribution, open_dataset
+from core.statistics import get_statistics
+from core.utilities import get_location_coordinates
+from script_main import (
+    get_date,
+    load_climatology,
+    load_series,
+    main_barplot,
+    render_lineplot,
+)
+
+# pyplot keeps global state, so only one figure is rendered at a time
+_render_lock = threading.Lock()
+
+
+def _location(name, lat, lon):
+    return {name: {'lat': lat, 'lon': lon}}
+
+
+def get_last_date(varn='tas'):
+    """Last day in the daily store (not cached as the store is updated daily)."""
+    with open_dataset(fn_current) as ds:
+        return '-'.join(get_date(ds[varn]))
+
+
+@lru_cache(maxsize=256)
+def get_series(name, lat, lon, date=None, varn='tas'):
+    return load_series(
+        location=_location(name, lat, lon),
+        varn=varn,
+        year=None if date is None else int(date[:4]),
+        enddate=date,
+    )
+
+
+@lru_cache(maxsize=256)
+def get_climatology(name, lat, lon, startyear_base=1940, endyear_base=2024, window_base=1, varn='tas'):
+    return load_climatology(
+        location=_location(name, lat, lon),
+        varn=varn,
+        startyear_base=startyear_base,
+        endyear_base=endyear_base,
+        window_base=window_base,
+    )
+
+
+@lru_cache(maxsize=256)
+def get_info(name, lat, lon, date=None, language='en', startyear_base=1940, endyear_base=2024, window_base=1, varn='tas'):
+    da = get_series(name, lat, lon, date, varn)
+    info = get_statistics(da, get_climatology(name, lat, lon, startyear_base, endyear_base, window_base, varn))
+    info['metadata'] = {
+        'varn': varn,
+        'location': _location(name, lat, lon),
+        'date': get_date(da),
+        'startyear_base': startyear_base,
+        'endyear_base': endyear_base,
+        'window_base': window_base,
+        'language': language,
+    }
+    return info
+
+
+@lru_cache(maxsize=128)
+def get_png(kind, name, lat, lon, date=None, language='en', startyear_base=1940, endyear_base=2024, window_base=1, varn='tas'):
+    kwargs = dict(
+        location=_location(name, lat, lon),
+        varn=varn,
+        language=language,
+        startyear_base=startyear_base,
+        endyear_base=endyear_base,
+        window_base=window_base,
+        save=False,
+        show=False,
+        buffer=True,
+    )
+    if kind == 'lineplot':
+        da = get_series(name, lat, lon, date, varn)
+        clim = get_climatology(name, lat, lon, startyear_base, endyear_base, window_base, varn)
+        with _render_lock:
+            buf, _ = render_lineplot(da, clim, None, **kwargs)
+    elif kind == 'barplot':
+        info = get_info(name, lat, lon, date, language, startyear_base, endyear_base, window_base, varn)
+        with _render_lock:
+            buf = main_barplot(info, **kwargs)
+    else:
+        raise NotImplementedError(kind)
+    return buf.getvalue()
+
+
+def info_to_json(info):
+    return json.dumps({
+        'metadata': info['metadata'],
+        'time': info['percentile band']['time'].dt.strftime('%Y-%m-%d').values.tolist(),
+        **{key: value.values.tolist() for key, value in info.items() if key != 'metadata'},
+    })
+
+
+def parse_query(query):
+    query = {key: values[0] for key, values in parse_qs(query).items()}
+    if 'location' not in query:
+        raise ValueError('Parameter "location" is required')
+    name = query['location']
+    if 'lat' in query and 'lon' in query:
+        lat, lon = float(query['lat']), float(query['lon'])
+    else:
+        coordinates = get_location_coordinates(name)[name]
+        if 'lat' not in coordinates:
+            raise ValueError(f'Location "{name}" not found, give lat and lon')
+        lat, lon = coordinates['lat'], coordinates['lon']
+
+    # resolve the latest day before the cache lookup to not return outdated figures
+    date = query['date'] if 'date' in query else get_last_date()
+    datetime.strptime(date, '%Y-%m-%d')  # raises ValueError for invalid dates
+
+    return dict(
+        name=name,
+        lat=lat,
+        lon=lon,
+        date=date,
+        language=query.get('language', 'en'),
+        startyear_base=int(query.get('startyear_base', 1940)),
+        endyear_base=int(query.get('endyear_base', 2024)),
+        window_base=int(query.get('window_base', 1)),
+    )
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            kwargs = parse_query(url.query)
+            if url.path in ['/lineplot', '/barplot']:
+                body = get_png(url.path.lstrip('/'), **kwargs)
+                content_type = 'image/png'
+            elif url.path == '/info':
+                body = info_to_json(get_info(**kwargs)).encode()
+                content_type = 'application/json'
+            else:
+                self.send_error(404, f'Unknown endpoint: {url.path}')
+                return
+        except FileNotFoundError as error:  # e.g., unknown base period
+            self.send_error(404, str(error))
+            return
+        except (KeyError, TypeError, ValueError) as error:
+            self.send_error(400, str(error))
+            return
+        except Exception as error:
+            self.send_error(500, str(error))
+            raise
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer handling requests in a fixed-size pool of worker threads."""
+
+    def __init__(self, server_address, handler, max_workers=4):
+        super().__init__(server_address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def read_input():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--host",
+        dest="host",
+        default="localhost",
+        type=str,
+        help="Host to listen on.",
+    )
+    parser.add_argument(
+        "--port",
+        dest="port",
+        default=8080,
+        type=int,
+        help="Port to listen on.",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="max_workers",
+        default=4,
+        type=int,
+        help="Number of worker threads.",
+    )
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+    input_ = read_input()
+    open_base_distribution()  # keep the default base distribution open
+    server = PooledHTTPServer((input_['host'], input_['port']), RequestHandler, max_workers=input_['max_workers'])
+    print('Serving on http://{host}:{port}'.format(**input_))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()